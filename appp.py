@@ -1,86 +1,209 @@
 import pandas as pd
-import numpy as np
-import plotly.express as px
 import plotly.graph_objs as go
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State, Patch, clientside_callback
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
 import os
 from datetime import datetime
+from functools import lru_cache
 
 ''''
 
-Usa pandas para manipulação de dados, numpy para cálculos numéricos, plotly para gráficos interativos, dash e seus componentes
+Usa pandas para manipulação de dados, plotly para gráficos interativos, dash e seus componentes
 para criar o dashboard web, dash_bootstrap_components para estilização com Bootstrap e dash_leaflet para mapas interativos.
+Se o pacote orjson estiver instalado (pip install orjson), o Dash o usa automaticamente para serializar as figuras em JSON.
 
 '''
 
 #  Carregamento e Pré-processamento dos Dados
 excel_path = "banco_dados_climaticos_consolidado (2).xlsx"
+# Cópia em Parquet da planilha, gerada automaticamente na primeira execução (bem mais rápida de ler que o Excel)
+parquet_path = "clima.parquet"
+# Colunas usadas pelo dashboard; as demais colunas da planilha não são carregadas
+data_columns = ["index", "cidade", "year", "tempMax", "tempMed", "tempMin", "isHW", "Lat", "Long"]
+# Tipos compactos (float32, int16 e categoria) reduzem a memória e os bytes percorridos em filtros e agrupamentos
+data_dtypes = {"tempMax": "float32", "tempMed": "float32", "tempMin": "float32",
+               "Lat": "float32", "Long": "float32", "year": "int16", "cidade": "category"}
 
 
 def load_data():
-    df = pd.read_excel(excel_path)
-    df["index"] = pd.to_datetime(df["index"])
-    df["isHW"] = df["isHW"].apply(lambda x: str(x).upper())
+    parquet_ok = os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(excel_path)
+    if parquet_ok:
+        df = pd.read_parquet(parquet_path, engine="pyarrow", columns=data_columns)
+    else:
+        df = pd.read_excel(excel_path, usecols=data_columns)
+        df["index"] = pd.to_datetime(df["index"])
+        df["isHW"] = df["isHW"].astype("string").str.upper().eq("TRUE").fillna(False).to_numpy(dtype=bool)
+    # Aplicado nos dois casos: o Parquet só é validado pela data, então não se confia nos tipos nem na ordem dele
+    df = df.astype(data_dtypes)
+    df = df.sort_values(["cidade", "year", "index"]).reset_index(drop=True)
+    if not parquet_ok:
+        # Grava em um arquivo temporário e só então o move para o lugar, para nunca deixar um Parquet pela metade
+        tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+            os.replace(tmp_path, parquet_path)
+        except OSError:
+            # Sem permissão de escrita ou disco cheio: segue apenas com os dados em memória
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    df["mes"] = df["index"].dt.month.astype("int8")  # Número do mês (1 a 12)
     return df
 
 ''''
-Lê um arquivo Excel com dados climáticos.
-Converte a coluna index para formato de data (datetime) e normaliza a coluna isHW
-para letras maiúsculas.
+Lê os dados climáticos do Parquet, se estiver atualizado, ou do Excel (gravando o Parquet para as próximas execuções).
+Converte index para data, isHW para booleano, reduz os tipos numéricos e ordena por cidade, ano e data.
 
 '''
 
-def calculate_hw_summary(df):
-    df_hw = df[df["isHW"] == "TRUE"].copy()
-    df_hw_grouped = df_hw.groupby(["cidade", "year"]).size().reset_index(name="dias_hw")
+def calculate_hw_summary(df_hw):
+    df_hw_grouped = df_hw.groupby(["cidade", "year"], observed=True).size().reset_index(name="dias_hw")
     return df_hw_grouped
 '''
-Filtra os dias com ondas de calor (isHW == TRUE) e agrupa por cidade e ano, contando o número de dias (dias_hw).
+Recebe apenas os dias com ondas de calor (isHW verdadeiro) e agrupa por cidade e ano, contando o número de dias (dias_hw).
 
 '''
 
-def calculate_anomalies(df, cidade):
-    baseline = df[df["cidade"] == cidade]["tempMed"].mean()
-    df_anomalia = df[df["cidade"] == cidade].groupby("year")["tempMed"].mean().reset_index()
-    df_anomalia["anomalia"] = df_anomalia["tempMed"] - baseline
-    return df_anomalia
+def build_heatmap_figure(df_hw_summary):
+    pivot = df_hw_summary.pivot(index="cidade", columns="year", values="dias_hw").fillna(0)
+    fig = go.Figure(go.Heatmap(z=pivot.values, x=list(pivot.columns), y=list(pivot.index),
+                               colorscale="OrRd", colorbar=dict(title="Dias de Onda de Calor"),
+                               hovertemplate="year=%{x}<br>cidade=%{y}<br>Dias de Onda de Calor=%{z}<extra></extra>"))
+    fig.update_layout(xaxis_title="year", yaxis_title="cidade")
+    return fig
+'''
+Monta o heatmap de dias de onda de calor a partir de uma tabela dinâmica (cidade x ano) já agregada,
+sem que o plotly precise agrupar os dados novamente.
+
 '''
-Calcula a média histórica da temperatura média (tempMed) para uma cidade (baseline) e subtrai essa baseline das temperaturas 
-médias anuais para obter anomalias.
 
+@lru_cache(maxsize=256)
+def slice_cy(cidade, ano):
+    try:
+        return df_idx.loc[(cidade, ano)]
+    except KeyError:
+        return df_idx.iloc[0:0]
 '''
+Seleciona as linhas de uma cidade e ano no DataFrame indexado por (cidade, year). A busca pelo índice ordenado
+evita varrer o DataFrame inteiro a cada interação; combinações inexistentes retornam um DataFrame vazio.
+O recorte fica em cache (lru_cache) e é compartilhado por quem precisar dos dados da mesma cidade e ano,
+por isso o DataFrame retornado não deve ser modificado.
+
+'''
+
+def calculate_anomalies(df):
+    means = df.groupby(["cidade", "year"], observed=True)["tempMed"].mean()
+    baselines = df.groupby("cidade", observed=True)["tempMed"].mean()
+    df_anomalia = means.reset_index()
+    df_anomalia["anomalia"] = df_anomalia["tempMed"] - baselines.reindex(df_anomalia["cidade"]).to_numpy()
+    df_anomalia["abs"] = df_anomalia["anomalia"].abs()
+    return {cidade: dff[["year", "tempMed", "anomalia", "abs"]].reset_index(drop=True)
+            for cidade, dff in df_anomalia.groupby("cidade", observed=True)}
+'''
+Calcula, de uma só vez para todas as cidades, a média histórica da temperatura média (tempMed) de cada cidade (baseline)
+e subtrai essa baseline das temperaturas médias anuais para obter anomalias. O valor absoluto (abs), usado como tamanho
+dos marcadores, também é calculado aqui. Retorna um dicionário cidade -> DataFrame.
+
+'''
+
+# Lista de todos os meses para garantir que todos apareçam, mesmo com frequência 0
+ALL_MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+
 # função para calcular frequência de ondas de calor por mês
-def calculate_hw_monthly(df, cidade, ano):
-    dff = df[(df["cidade"] == cidade) & (df["year"] == ano) & (df["isHW"] == "TRUE")].copy()
-    dff["mes"] = dff["index"].dt.strftime("%B")  # Nome completo do mês
-    monthly_counts = dff.groupby("mes").size().reset_index(name="frequencia")
-
-    # ListaR de todos os meses para garantir que todos apareçam, mesmo com frequência 0
-    all_months = [
-        "January", "February", "March", "April", "May", "June",
-        "July", "August", "September", "October", "November", "December"
+def calculate_hw_monthly(df_hw, cidades, anos):
+    monthly_counts = df_hw.groupby(["cidade", "year", "mes"], observed=True).size()
+    monthly_counts = monthly_counts.reindex(
+        pd.MultiIndex.from_product([cidades, anos, range(1, 13)], names=["cidade", "year", "mes"]),
+        fill_value=0
+    )
+    return {(cidade, ano): pd.DataFrame({"mes": ALL_MONTHS, "frequencia": counts.to_numpy()})
+            for (cidade, ano), counts in monthly_counts.groupby(level=["cidade", "year"], sort=False)}
+
+''''
+A partir dos dias com isHW verdadeiro, conta a frequência de ondas de calor por cidade, ano e mês em um único groupby
+sobre o número do mês; os nomes dos meses só entram na tabela final. Garante que todos os meses apareçam,
+mesmo com frequência zero. Retorna um dicionário (cidade, ano) -> DataFrame.
+
+'''
+
+def _build_temp_traces(cidade, ano):
+    dff = slice_cy(cidade, ano)
+    temps = dff[["tempMax", "tempMed", "tempMin"]].astype("float64").round(2)
+    return dff["index"], temps["tempMax"], temps["tempMed"], temps["tempMin"]
+'''
+Separa as séries de data e de temperaturas máxima, média e mínima usadas no gráfico de temperaturas diárias.
+Os valores em float32 são arredondados em float64 para que o JSON enviado não carregue dígitos espúrios
+(31.7, e não 31.700000762939453).
+
+'''
+
+# Figura base do gráfico de temperaturas diárias, montada (e validada pelo plotly) uma única vez na importação
+_TEMP_TEMPLATE = go.Figure(
+    data=[
+        go.Scattergl(mode="lines", name="Máxima", line=dict(color="red")),
+        go.Scattergl(mode="lines", name="Média", line=dict(color="blue")),
+        go.Scattergl(mode="lines", name="Mínima", line=dict(color="green")),
+    ],
+    layout=dict(xaxis=dict(title=dict(text="Data")), yaxis=dict(title=dict(text="Temperatura (°C)")),
+                uirevision="temp")
+)
+'''
+As três séries começam vazias. O callback só altera os dados das séries e o título (Patch), sem recriar
+nem revalidar a figura. O uirevision fixo mantém a legenda e as séries ocultadas entre as seleções; o zoom dos eixos
+é reiniciado quando muda o ano (eixo x) ou a cidade e o ano (eixo y), para nunca ficar fora dos novos dados.
+
+'''
+
+def build_city_geojson(city_coords):
+    features = [
+        {"type": "Feature",
+         "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+         "properties": {"cidade": cidade, "tooltip": cidade}}
+        for cidade, lat, lon in city_coords.itertuples(index=False)
     ]
-    monthly_counts = pd.DataFrame({"mes": all_months}).merge(
-        monthly_counts, on="mes", how="left"
-    ).fillna({"frequencia": 0})
+    return {"type": "FeatureCollection", "features": features}
+'''
+Converte as coordenadas das estações em um único FeatureCollection GeoJSON, desenhado pelo Leaflet no navegador.
+A propriedade tooltip é exibida automaticamente pelo dl.GeoJSON ao passar o mouse sobre a estação.
 
-    return monthly_counts
+'''
 
-''''
-Filtra dados por cidade, ano e isHW == TRUE, extrai o nome do mês e conta a frequência de ondas de calor por mês. 
-Garante que todos os meses apareçam, mesmo com frequência zero.
+def build_store_data(anomalies_by_city, hw_monthly):
+    store_data = {"anomalies": {}, "hw_monthly": {}, "months": ALL_MONTHS}
+    for cidade, dff in anomalies_by_city.items():
+        valores = dff[["anomalia", "abs"]].astype("float64").round(3)
+        store_data["anomalies"][cidade] = {"year": dff["year"].tolist(), "anomalia": valores["anomalia"].tolist(),
+                                            "abs": valores["abs"].tolist()}
+    for (cidade, ano), dff in hw_monthly.items():
+        store_data["hw_monthly"].setdefault(cidade, {})[str(ano)] = dff["frequencia"].tolist()
+    return store_data
+'''
+Serializa as tabelas pré-calculadas de anomalias e de ondas de calor por mês em listas simples, enviadas uma única vez
+ao navegador pelo dcc.Store (data-store) e usadas pelos callbacks executados no cliente.
 
 '''
 
 #  Inicialização ( Carrega os dados, calcula o resumo de ondas de calor e extrai listas de cidades e anos
 #  únicos para uso nos controles do dashboard.)
 df = load_data()
-df_hw_summary = calculate_hw_summary(df)
+# Dias com onda de calor, filtrados uma única vez pela coluna booleana isHW e reutilizados nos agrupamentos abaixo
+df_hw = df[df["isHW"]]
+df_hw_summary = calculate_hw_summary(df_hw)
+heatmap_fig = build_heatmap_figure(df_hw_summary)
+# Cópias indexadas para que os callbacks façam buscas por rótulo em vez de filtros booleanos no DataFrame inteiro
+df_idx = df.set_index(["cidade", "year"]).sort_index()
 cidades = sorted(df["cidade"].unique())
-anos = sorted(df["year"].unique())
+anos = sorted(df["year"].unique().tolist())
+# Coordenadas de cada estação (uma linha por cidade), usadas nos marcadores e no centro do mapa
+city_coords = df.groupby("cidade", as_index=False, observed=True)[["Lat", "Long"]].first()
+# Tabelas pequenas pré-calculadas; os callbacks apenas consultam estes dicionários
+anomalies_by_city = calculate_anomalies(df)
+hw_monthly = calculate_hw_monthly(df_hw, cidades, anos)
+store_data = build_store_data(anomalies_by_city, hw_monthly)
 
 #  Inicialização do App (Cria uma aplicação Dash com o tema Bootstrap para estilização.)
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -89,19 +212,16 @@ app.title = "Dashboard de Ondas de Calor"
 #  Layout (Define um layout com um título e cinco abas dentro de um contêiner (dbc.Container).)
 app.layout = dbc.Container([
     html.H2("Dashboard de Ondas de Calor", className="text-center my-4"),
+    dcc.Store(id="data-store", data=store_data),
 # Exibe um mapa interativo com marcadores para cada cidade, usando latitude (Lat) e longitude (Long).
-    # Cada marcador tem  o nome da cidade.
+    # Cada marcador tem  o nome da cidade; estações próximas são agrupadas (cluster) e expandidas ao clicar.
     dcc.Tabs([
         dcc.Tab(label="Mapa das Estações", children=[
             dl.Map([
                 dl.TileLayer(),
-                dl.LayerGroup([
-                    dl.Marker(position=(row["Lat"], row["Long"]),
-                              children=dl.Tooltip(row["cidade"]))
-                    for _, row in df.drop_duplicates("cidade")[["cidade", "Lat", "Long"]].iterrows()
-                ])
+                dl.GeoJSON(data=build_city_geojson(city_coords), cluster=True, zoomToBoundsOnClick=True)
             ], style={"width": "100%", "height": "600px"},
-                center=(df["Lat"].mean(), df["Long"].mean()), zoom=6)
+                center=(float(city_coords["Lat"].mean()), float(city_coords["Long"].mean())), zoom=6)
         ]),
 #Interface com um dropdown para selecionar a cidade, um slider para o ano e um gráfico que será atualizado dinamicamente.
 
@@ -113,7 +233,7 @@ app.layout = dbc.Container([
                 html.Label("Ano:"),
                 dcc.Slider(min=min(anos), max=max(anos), step=1, value=max(anos),
                            marks={int(a): str(a) for a in anos}, id="ano-temp"),
-                dcc.Loading(dcc.Graph(id="grafico-temp"))
+                dcc.Loading(dcc.Graph(id="grafico-temp", figure=_TEMP_TEMPLATE))
             ], className="p-4")
         ]),
 
@@ -130,10 +250,7 @@ app.layout = dbc.Container([
         dcc.Tab(label="Heatmap de Dias de Onda de Calor", children=[
             html.Div([
                 dcc.Loading(dcc.Graph(id="heatmap-hw",
-                                      figure=px.density_heatmap(df_hw_summary,
-                                                                x="year", y="cidade", z="dias_hw",
-                                                                color_continuous_scale="OrRd",
-                                                                labels={"dias_hw": "Dias de Onda de Calor"})))
+                                      figure=heatmap_fig))
             ], className="p-4")
         ]),
 # Exibe um heatmap fixo mostrando o número de dias de onda de calor por cidade e ano.
@@ -159,58 +276,78 @@ app.layout = dbc.Container([
     Input("ano-temp", "value")
 )
 def update_temp_plot(cidade, ano):
-    dff = df[(df["cidade"] == cidade) & (df["year"] == ano)]
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dff["index"], y=dff["tempMax"], mode="lines", name="Máxima", line=dict(color="red")))
-    fig.add_trace(go.Scatter(x=dff["index"], y=dff["tempMed"], mode="lines", name="Média", line=dict(color="blue")))
-    fig.add_trace(go.Scatter(x=dff["index"], y=dff["tempMin"], mode="lines", name="Mínima", line=dict(color="green")))
-    fig.update_layout(title=f"Temperaturas em {cidade} ({ano})", xaxis_title="Data", yaxis_title="Temperatura (°C)")
-    return fig
-#Gera um gráfico de dispersão mostrando anomalias de temperatura anual para a cidade selecionada.
-
-
-
-@app.callback(
+    datas, temp_max, temp_med, temp_min = _build_temp_traces(cidade, ano)
+    patch = Patch()
+    for i, temps in enumerate((temp_max, temp_med, temp_min)):
+        patch["data"][i]["x"] = datas
+        patch["data"][i]["y"] = temps
+    patch["layout"]["title"] = {"text": f"Temperaturas em {cidade} ({ano})"}
+    # Datas só mudam com o ano; a faixa de temperaturas muda também com a cidade
+    patch["layout"]["xaxis"]["uirevision"] = ano
+    patch["layout"]["yaxis"]["uirevision"] = f"{cidade}-{ano}"
+    return patch
+
+
+
+# Os gráficos de anomalias e polar são montados no navegador (clientside_callback) a partir das tabelas
+# pré-calculadas em data-store, sem ida e volta ao servidor a cada seleção.
+clientside_callback(
+    """
+    function(cidade, data) {
+        const d = data.anomalies[cidade] || {year: [], anomalia: [], abs: []};
+        const sizeMax = Math.max(0, ...d.abs);
+        return {
+            data: [{
+                type: "scattergl",
+                mode: "markers",
+                x: d.year,
+                y: d.anomalia,
+                marker: {size: d.abs, sizemode: "area", sizeref: sizeMax > 0 ? 2 * sizeMax / (20 * 20) : 1},
+                hovertemplate: "year=%{x}<br>Anomalia (°C)=%{y}<extra></extra>"
+            }],
+            layout: {
+                title: {text: `Anomalias de Temperatura Média - ${cidade}`},
+                xaxis: {title: {text: "year"}},
+                yaxis: {title: {text: "Anomalia (°C)"}}
+            }
+        };
+    }
+    """,
     Output("grafico-anomalia", "figure"),
-    Input("cidade-anomalia", "value")
+    Input("cidade-anomalia", "value"),
+    State("data-store", "data")
 )
-def update_anomaly_plot(cidade):
-    df_anomalia = calculate_anomalies(df, cidade)
-    fig = px.scatter(df_anomalia, x="year", y="anomalia", size=np.abs(df_anomalia["anomalia"]),
-                     title=f"Anomalias de Temperatura Média - {cidade}",
-                     labels={"anomalia": "Anomalia (°C)"})
-    return fig
+#Gera um gráfico de dispersão mostrando anomalias de temperatura anual para a cidade selecionada.
 
 
 #  callback para o gráfico polar
-@app.callback(
+clientside_callback(
+    """
+    function(cidade, ano, data) {
+        const r = (data.hw_monthly[cidade] || {})[ano] || data.months.map(() => 0);
+        return {
+            data: [{
+                type: "scatterpolar",
+                r: r,
+                theta: data.months,
+                fill: "toself",
+                mode: "lines+markers",
+                line: {color: "blue"},
+                marker: {color: "blue"}
+            }],
+            layout: {
+                polar: {radialaxis: {visible: true}},
+                title: {text: `Frequência de Ondas de Calor em ${cidade} - ${ano}`},
+                showlegend: false
+            }
+        };
+    }
+    """,
     Output("grafico-polar", "figure"),
     Input("cidade-polar", "value"),
-    Input("ano-polar", "value")
+    Input("ano-polar", "value"),
+    State("data-store", "data")
 )
-def update_polar_plot(cidade, ano):
-    df_polar = calculate_hw_monthly(df, cidade, ano)
-
-    # Criar o gráfico polar
-    fig = go.Figure()
-    fig.add_trace(go.Scatterpolar(
-        r=df_polar["frequencia"],
-        theta=df_polar["mes"],
-        fill="toself",
-        mode="lines+markers",
-        line=dict(color="blue"),
-        marker=dict(color="blue")
-    ))
-
-    fig.update_layout(
-        polar=dict(
-            radialaxis=dict(visible=True)
-        ),
-        title=f"Frequência de Ondas de Calor em {cidade} - {ano}",
-        showlegend=False
-    )
-
-    return fig
 #Cria um gráfico polar mostrando a frequência de ondas de calor por mês para a cidade e ano selecionados.
 
 